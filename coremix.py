@@ -3,16 +3,58 @@ import usb.util
 import hid
 import pythoncom
 import argparse
+import array
+import functools
 import logging
 import os
+import queue
 import sys
 import threading
-import time
 import json
 
+from comtypes import COMError
 from enum import Enum
 from psutil import NoSuchProcess
-from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
+from pycaw.callbacks import AudioSessionEvents, AudioSessionNotification
+from pycaw.pycaw import AudioSession, AudioUtilities, IAudioSessionControl2, ISimpleAudioVolume
+
+# usb1 enables asynchronous transfers; without it the reader falls back to blocking pyusb reads
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+
+class Category(Enum):
+    VOICE = "voice"
+    EXCLUDE = "exclude"
+    SYSTEM = "system"
+
+
+class NewSessionNotification(AudioSessionNotification):
+    """
+    COM event sink that queues newly created audio sessions for the monitor thread.
+    """
+    def __init__(self, new_session_queue):
+        super().__init__()
+        self.new_session_queue = new_session_queue
+
+    def on_session_created(self, new_session):
+        self.new_session_queue.put(new_session)
+
+
+class SessionStateNotification(AudioSessionEvents):
+    """
+    COM event sink that evicts a session from the volume cache once it expires.
+    """
+    def __init__(self, session_id, evict):
+        super().__init__()
+        self.session_id = session_id
+        self.evict = evict
+
+    def on_state_changed(self, new_state, new_state_id):
+        if new_state == "Expired":
+            self.evict(self.session_id)
 
 
 class CoreMix:
@@ -37,16 +79,41 @@ class CoreMix:
 
         # Tracking of sessions
         self.known_sessions = set()
-        self.voice_ids = set()
-        self.exclude_ids = set()
+        self.new_session_queue = queue.Queue()
+
+        # Cached ISimpleAudioVolume interfaces keyed by session instance identifier
+        # (one process can hold several sessions with independent lifetimes), so
+        # dial ticks never have to re-enumerate sessions or re-QueryInterface
+        self._vol_cache = {}
+        self._sessions = {}
+
+        # Cache of process names keyed by process id; a name never changes for a
+        # live pid, so each one only costs a psutil lookup once
+        self._name_cache = {}
+
+        # Audio session manager, created once and reused for registration and
+        # enumeration instead of re-activating the COM chain per call
+        self._session_manager = None
+        self._session_manager_lock = threading.Lock()
+
+        # Last levels actually applied, globally and per session, so repeated
+        # identical dial packets don't re-issue SetMasterVolume calls
+        self._last_applied = (None, None)
+        self._session_last = {}
 
         # Set the initial values for USB device and session
         self.dev = None
         self.interface = None
         self.endpoint = None
 
-        # Set up exit event
+        # Consecutive failed asynchronous transfers; used to stop re-arming a
+        # stalled or failing endpoint instead of spinning on it
+        self._transfer_errors = 0
+
+        # Set up exit event and thread handles
         self.exit_event = threading.Event()
+        self._usb_thread = None
+        self._monitor_thread = None
 
         # Automatically find the USB device during initialization
         self.find_usb_device()
@@ -86,118 +153,391 @@ class CoreMix:
     def usb_reader(self):
         """
         Thread function for reading data from the USB device.
+
+        Uses asynchronous libusb transfers when the usb1 module is available so a
+        read is always armed while Python processes the previous report; falls
+        back to blocking pyusb reads otherwise.
         """
         self.log.info("Starting USB chatmix dial position monitoring thread")
-        pythoncom.CoInitialize()
+        # MTA, matching the monitor thread so the cached ISimpleAudioVolume
+        # pointers can be used from here without cross-apartment marshaling
+        pythoncom.CoInitializeEx(pythoncom.COINIT_MULTITHREADED)
         try:
-            while not self.exit_event.is_set():
-                try:
-                    data = self.dev.read(self.endpoint.bEndpointAddress, self.endpoint.wMaxPacketSize, timeout=0)
-                    if data is not None:
-                        voice_level = data[2]
-                        system_level = data[1]
-
-                        if voice_level == 100 or system_level == 100:
-                            self.log.info(f'Voice Level: {voice_level}, System Level: {system_level}')
-                            self.voice_level = voice_level
-                            self.system_level = system_level
-                            self.set_volume_levels(self.voice_level, self.system_level)
-                        else:
-                            self.log.debug('Voice or system level not at 100, ignoring this from the headset')
-                except usb.core.USBError as e:
-                    if e.errno == 110:  # Timeout error, just continue
-                        continue
-                    elif e.errno == 19:  # Device disconnected
-                        self.log.info("USB device disconnected.")
-                        break
-                    else:
-                        self.log.exception(f"USB error: {e}")
-                except KeyboardInterrupt:
-                    raise
+            if usb1 is not None:
+                self.usb_reader_async()
+            else:
+                self.usb_reader_blocking()
         except KeyboardInterrupt:
             raise
         except Exception as e:
-            self.log.exception(f"Unexpected error in USB thread: {e}")
+            self.log.exception("Unexpected error in USB thread: %s", e)
         finally:
+            # Make sure the rest of the application shuts down if the reader exits on its own
+            self.exit_event.set()
             usb.util.dispose_resources(self.dev)
 
+    def usb_reader_blocking(self):
+        """
+        Blocking pyusb read loop, used when usb1 is not available.
+        """
+        # Bind the descriptor attributes and bound methods to locals; pyusb walks
+        # the descriptor object on every attribute access otherwise
+        ep_addr = self.endpoint.bEndpointAddress
+        pkt_size = self.endpoint.wMaxPacketSize
+        dev_read = self.dev.read
+        exit_is_set = self.exit_event.is_set
+
+        # Preallocated single-report buffer; a larger read would only complete on
+        # buffer-full or timeout since the dial's reports fill a whole packet
+        buf = array.array('B', bytes(pkt_size))
+        while not exit_is_set():
+            try:
+                # Finite timeout so the loop wakes to check exit_event; timeout=0
+                # would wait forever and block shutdown until the next packet
+                num_bytes = dev_read(ep_addr, buf, timeout=200)
+                levels = self.parse_level_reports(buf, num_bytes, pkt_size)
+
+                # Drain any reports queued behind the first with short reads so a
+                # fast dial sweep collapses into a single volume pass, without
+                # delaying the common single-report case
+                for _ in range(7):
+                    try:
+                        num_bytes = dev_read(ep_addr, buf, timeout=5)
+                    except usb.core.USBError as drain_error:
+                        if drain_error.errno == 110:  # Device idle, burst drained
+                            break
+                        raise
+                    drained = self.parse_level_reports(buf, num_bytes, pkt_size)
+                    if drained is not None:
+                        levels = drained
+
+                self.apply_levels(levels)
+            except usb.core.USBError as e:
+                if e.errno == 110:  # Timeout with no data, check exit_event again
+                    continue
+                elif e.errno == 19:  # Device disconnected
+                    self.log.info("USB device disconnected.")
+                    break
+                else:
+                    self.log.exception("USB error: %s", e)
+
+    def usb_reader_async(self):
+        """
+        Asynchronous libusb read loop keeping two interrupt transfers in flight so
+        the kernel always has a read armed while a report is being processed.
+        """
+        pkt_size = self.endpoint.wMaxPacketSize
+        with usb1.USBContext() as context:
+            handle = context.openByVendorIDAndProductID(self.vendor_id, self.product_id)
+            if handle is None:
+                raise ValueError('Device not found')
+
+            try:
+                handle.setAutoDetachKernelDriver(True)
+            except usb1.USBError:
+                pass  # Not supported on this platform
+
+            handle.claimInterface(self.interface_number)
+            transfers = []
+            try:
+                for _ in range(2):
+                    transfer = handle.getTransfer()
+                    transfer.setInterrupt(self.endpoint_address, pkt_size, callback=self.handle_usb_transfer)
+                    transfer.submit()
+                    transfers.append(transfer)
+
+                while not self.exit_event.is_set() and any(t.isSubmitted() for t in transfers):
+                    context.handleEventsTimeout(tv=0.5)
+            finally:
+                for transfer in transfers:
+                    if transfer.isSubmitted():
+                        try:
+                            transfer.cancel()
+                        except usb1.USBError:
+                            pass
+                while any(t.isSubmitted() for t in transfers):
+                    context.handleEventsTimeout(tv=0.1)
+                try:
+                    handle.releaseInterface(self.interface_number)
+                except usb1.USBError:
+                    pass  # Device already gone
+
+    def handle_usb_transfer(self, transfer):
+        """
+        Completion callback for asynchronous transfers; handles the reports and
+        re-submits the transfer so a read stays armed.
+        """
+        status = transfer.getStatus()
+        if status == usb1.TRANSFER_COMPLETED:
+            self._transfer_errors = 0
+            self.handle_level_reports(transfer.getBuffer(), transfer.getActualLength(), self.endpoint.wMaxPacketSize)
+        elif status == usb1.TRANSFER_TIMED_OUT:
+            pass  # No data this round, just re-arm the transfer
+        elif status == usb1.TRANSFER_NO_DEVICE:
+            self.log.info("USB device disconnected.")
+            return
+        elif status == usb1.TRANSFER_CANCELLED:
+            return
+        else:
+            # Stall, overflow, or other error; re-arming a persistently failing
+            # endpoint forever would just spin at 100% CPU
+            self._transfer_errors += 1
+            self.log.warning("USB transfer failed with status %s (%s consecutive errors)", status, self._transfer_errors)
+            if self._transfer_errors >= 5:
+                self.log.error("Giving up on USB transfers after repeated errors")
+                return
+
+        if not self.exit_event.is_set():
+            transfer.submit()
+
+    def handle_level_reports(self, buf, num_bytes, pkt_size):
+        """
+        Apply the last valid level pair from a batch of dial reports, if any.
+        """
+        self.apply_levels(self.parse_level_reports(buf, num_bytes, pkt_size))
+
+    def apply_levels(self, levels):
+        """
+        Apply a coalesced (voice_level, system_level) pair, ignoring None.
+        """
+        if levels is not None:
+            voice_level, system_level = levels
+            if self.log.isEnabledFor(logging.INFO):
+                self.log.info('Voice Level: %s, System Level: %s', voice_level, system_level)
+            self.voice_level = voice_level
+            self.system_level = system_level
+            self.set_volume_levels(voice_level, system_level)
+
+    def parse_level_reports(self, buf, num_bytes, pkt_size):
+        """
+        Parse a batch of dial reports, keeping only the last valid level pair so a
+        fast dial sweep triggers a single volume pass.
+        """
+        levels = None
+        for offset in range(0, num_bytes, pkt_size):
+            if offset + 2 >= num_bytes:
+                break
+            voice_level = buf[offset + 2]
+            system_level = buf[offset + 1]
+
+            # Data should only be used if one of the levels is 100, because for some
+            # reason sometimes the headset sends an incorrect amount
+            if voice_level == 100 or system_level == 100:
+                levels = (voice_level, system_level)
+            else:
+                self.log.debug('Voice or system level not at 100, ignoring this from the headset')
+
+        return levels
+
     def monitor_new_sessions(self):
         """
-        Polling function for monitoring new audio sessions.
+        Thread function for monitoring new audio sessions via session creation callbacks.
         """
         self.log.info("Starting audio session monitoring thread")
-        pythoncom.CoInitialize()
-        self.known_sessions = set((session.Process.name(), session.ProcessId) for session in AudioUtilities.GetAllSessions() if session.Process)
-        while not self.exit_event.is_set():
-            try:
-                current_sessions = set((session.Process.name(), session.ProcessId) for session in AudioUtilities.GetAllSessions() if session.Process)
-                new_sessions = current_sessions - self.known_sessions
-                if new_sessions:
-                    print(self.voice_apps)
-                    for app_name, app_id in new_sessions:
-                        print(app_name)
-                        if app_name in self.voice_apps:
-                            self.voice_ids.add(app_id)
-                            self.log.info(f"New voice audio session: {app_name} {app_id}")
-                        elif app_name in self.exclude_apps:
-                            self.exclude_ids.add(app_id)
-                            self.log.debug(f"Ignoring new audio session: {app_name} {app_id}")
-                        else:
-                            self.log.info(f"New general audio session: {app_name} {app_id}")
-                    self.set_volume_levels(self.voice_level, self.system_level)
-
-                self.known_sessions = current_sessions
-                time.sleep(1)
-            except NoSuchProcess:
+        # Must be MTA: pycaw's AudioSessionNotification documents that
+        # OnSessionCreated never fires in a single-threaded apartment
+        pythoncom.CoInitializeEx(pythoncom.COINIT_MULTITHREADED)
+
+        notification = None
+        try:
+            # Register for OnSessionCreated callbacks so the thread only wakes when a new session appears
+            session_manager = self._get_session_manager()
+            if session_manager is None:
+                self.log.error("No default audio device found, cannot monitor audio sessions")
+                return
+            sink = NewSessionNotification(self.new_session_queue)
+            session_manager.RegisterSessionNotification(sink)
+            notification = sink
+
+            # Take an initial snapshot to classify the sessions that already exist; enumerating
+            # once is also required before the registered callbacks start firing
+            for session in self._get_all_sessions():
+                try:
+                    if session.Process:
+                        self.handle_new_session(session)
+                except NoSuchProcess:
+                    continue
+                except COMError as e:
+                    self.log.warning("COM error classifying audio session: %s", e)
+                    continue
+
+            while not self.exit_event.is_set():
+                try:
+                    session = self.new_session_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                try:
+                    if session.Process and self.handle_new_session(session):
+                        self.set_volume_levels(self.voice_level, self.system_level)
+                except NoSuchProcess:
+                    continue
+                except COMError as e:
+                    self.log.warning("COM error handling new audio session: %s", e)
+                    continue
+        except Exception as e:
+            self.log.exception("Unexpected error in session monitor thread: %s", e)
+        finally:
+            # Make sure the rest of the application shuts down if the monitor exits on its own
+            self.exit_event.set()
+            if notification is not None:
+                session_manager.UnregisterSessionNotification(notification)
+
+    def _get_session_manager(self):
+        """
+        Return the cached IAudioSessionManager2, activating it on first use.
+        """
+        with self._session_manager_lock:
+            if self._session_manager is None:
+                self._session_manager = AudioUtilities.GetAudioSessionManager()
+        return self._session_manager
+
+    def _get_all_sessions(self):
+        """
+        Enumerate the current audio sessions via the cached session manager.
+        """
+        sessions = []
+        session_enumerator = self._get_session_manager().GetSessionEnumerator()
+        for i in range(session_enumerator.GetCount()):
+            ctl = session_enumerator.GetSession(i)
+            if ctl is None:
                 continue
+            sessions.append(AudioSession(ctl.QueryInterface(IAudioSessionControl2)))
+        return sessions
+
+    def handle_new_session(self, session):
+        """
+        Classify a newly created audio session, returning whether it was actually new.
+        """
+        # Track by session instance identifier rather than pid: a process can open a
+        # second session while its first is still alive, and the two expire separately
+        session_id = session._ctl.GetSessionInstanceIdentifier()
+        if session_id in self.known_sessions:
+            return False
+        self.known_sessions.add(session_id)
+
+        app_id = session.ProcessId
+        app_name = self._name(app_id, session.Process)
+
+        if app_name in self.voice_apps:
+            category = Category.VOICE
+            self.log.info("New voice audio session: %s %s", app_name, app_id)
+        elif app_name in self.exclude_apps:
+            category = Category.EXCLUDE
+            self.log.debug("Ignoring new audio session: %s %s", app_name, app_id)
+        else:
+            category = Category.SYSTEM
+            self.log.info("New general audio session: %s %s", app_name, app_id)
+
+        # QueryInterface once per session and cache the volume interface; the session
+        # wrapper is kept alive so its expiry callback stays registered
+        self._vol_cache[session_id] = (session._ctl.QueryInterface(ISimpleAudioVolume), app_name, app_id, category)
+        self._sessions[session_id] = session
+        session.register_notification(SessionStateNotification(session_id, self.evict_session))
+
+        # Invalidate the global short-circuit so the next set_volume_levels call
+        # reaches this session; unchanged sessions are still skipped per-session
+        self._last_applied = (None, None)
+
+        return True
+
+    def _name(self, app_id, process):
+        """
+        Look up a process name, hitting psutil only the first time a pid is seen.
+        """
+        app_name = self._name_cache.get(app_id)
+        if app_name is None:
+            app_name = process.name()
+            self._name_cache[app_id] = app_name
+        return app_name
+
+    def evict_session(self, session_id):
+        """
+        Drop an expired session from the caches and tracking sets.
+        """
+        entry = self._vol_cache.pop(session_id, None)
+        self._sessions.pop(session_id, None)
+        self._session_last.pop(session_id, None)
+        self.known_sessions.discard(session_id)
+
+        if entry is None:
+            return
+        app_name, app_id = entry[1], entry[2]
+        self.log.debug("Audio session expired: %s %s", app_name, app_id)
+
+        # Only drop the pid-level state once no other session from the process remains
+        if not any(cached[2] == app_id for cached in self._vol_cache.values()):
+            self._name_cache.pop(app_id, None)
 
     def set_volume_levels(self, voice_level, system_level):
         """
         Set the volume levels for the voice and system applications.
         """
-        sessions = AudioUtilities.GetAllSessions()
+        if (voice_level, system_level) == self._last_applied:
+            return
+
+        # Scale both levels once instead of once per session
+        voice_scalar = voice_level * 0.01
+        system_scalar = system_level * 0.01
+
+        # Checked once so the disabled-logging hot path skips the call entirely
+        debug_enabled = self.log.isEnabledFor(logging.DEBUG)
+
+        for session_id, (volume, app_name, app_id, category) in list(self._vol_cache.items()):
+            if category is Category.VOICE:
+                level, scalar = voice_level, voice_scalar
+            elif category is Category.EXCLUDE:
+                if debug_enabled:
+                    self.log.debug("Ignoring volume for %s", app_name)
+                continue
+            else:
+                level, scalar = system_level, system_scalar
 
-        for session in sessions:
-            if session.Process:
-                volume = session._ctl.QueryInterface(ISimpleAudioVolume)
-                app_name = session.Process.name()
-                app_id = session.ProcessId
+            # Skip sessions whose category level hasn't moved since the last call
+            if self._session_last.get(session_id) == level:
+                continue
 
-                if app_id in self.voice_ids:
-                    self.log.debug(f"Setting volume for {app_name} to {voice_level}")
-                    volume.SetMasterVolume(voice_level / 100, None)
-                elif app_id in self.exclude_ids:
-                    self.log.debug(f"Ignoring volume for {app_name}")
-                else:
-                    self.log.debug(f"Setting volume for {app_name} {app_id} to {system_level}")
-                    volume.SetMasterVolume(system_level / 100, None)
+            if debug_enabled:
+                self.log.debug("Setting volume for %s %s to %s", app_name, app_id, level)
+            try:
+                volume.SetMasterVolume(scalar, None)
+            except COMError as e:
+                # Session died without delivering an Expired callback; drop it
+                # rather than letting one flaky session kill the calling thread
+                self.log.warning("Dropping audio session %s %s after COM error: %s", app_name, app_id, e)
+                self.evict_session(session_id)
+                continue
+            self._session_last[session_id] = level
+
+        self._last_applied = (voice_level, system_level)
 
     def run(self):
         """
         Start the threads for USB reading and audio session monitoring.
         """
         # Start USB reading thread
-        usb_thread = threading.Thread(target=self.usb_reader)
-        usb_thread.start()
+        self._usb_thread = threading.Thread(target=self.usb_reader, daemon=True)
+        self._usb_thread.start()
 
-        # Start audio sessions monitoring thread 
-        monitor_thread = threading.Thread(target=self.monitor_new_sessions)
-        monitor_thread.start()
+        # Start audio sessions monitoring thread
+        self._monitor_thread = threading.Thread(target=self.monitor_new_sessions, daemon=True)
+        self._monitor_thread.start()
 
         try:
-            while usb_thread.is_alive() or monitor_thread.is_alive():
-                usb_thread.join(timeout=0.1)
-                monitor_thread.join(timeout=0.1)
+            # Sleep until shutdown is signalled; the worker threads set the event
+            # themselves if they exit abnormally (e.g. device disconnect). The
+            # timeout keeps Ctrl-C deliverable on Windows, where an untimed wait
+            # on the main thread can't be interrupted by the signal handler
+            while not self.exit_event.wait(timeout=1):
+                pass
         except KeyboardInterrupt:
             self.log.info("Exiting...")
-            self.exit_event.set()
-            usb_thread.join()
         except Exception as e:
-            self.log.exception(f"Unexpected error: {e}")
+            self.log.exception("Unexpected error: %s", e)
         finally:
+            self.exit_event.set()
             usb.util.dispose_resources(self.dev)
-            if usb_thread.is_alive():
-                usb_thread.join()
+            self._usb_thread.join()
+            self._monitor_thread.join()
 
             sys.exit(0)
 
@@ -207,11 +547,11 @@ class CoreMix:
         """
         self.log.info("Stopping the application...")
         self.exit_event.set()  # Signal the threads to exit
-        # Wait for the threads to finish
-        usb_thread = threading.Thread(target=self.usb_reader)
-        monitor_thread = threading.Thread(target=self.monitor_new_sessions)
-        usb_thread.join()
-        monitor_thread.join()
+        # Wait for the running threads to finish
+        if self._usb_thread is not None:
+            self._usb_thread.join()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
         self.log.info("Application stopped gracefully.")
 
 
@@ -229,41 +569,44 @@ def parse_arguments():
     return parser.parse_args()
 
 
+# Config fields that may be given as hex strings (e.g. "0x1038")
+_HEX_FIELDS = ("vendor_id", "product_id", "endpoint_address")
+
+
+def _to_int(value):
+    # int(x, 0) handles both "0x..." hex strings and decimal strings
+    return value if isinstance(value, int) else int(value, 0)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config_cached(file_path, mtime):
+    with open(file_path, "r") as file:
+        config = json.load(file)
+
+    for key in _HEX_FIELDS:
+        if key in config:
+            config[key] = _to_int(config[key])
+
+    return config
+
+
 def load_config(file_path, logger):
     if not os.path.isabs(file_path):
         file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
 
-    config = {}
     try:
-        with open(file_path, "r") as file:
-            config = json.load(file)
-
-        def convert_hex(value):
-            if isinstance(value, str):
-                if value.startswith("0x"):
-                    try:
-                        return int(value, 16)
-                    except ValueError:
-                        logger.warning(f"Invalid hexadecimal value: {value}")
-                else:
-                    return int(value)
-            return value
-
-        if "vendor_id" in config:
-            config["vendor_id"] = convert_hex(config["vendor_id"])
-        if "product_id" in config:
-            config["product_id"] = convert_hex(config["product_id"])
-        if "endpoint_address" in config:
-            config["endpoint_address"] = convert_hex(config["endpoint_address"])
-
+        # Memoized on path + mtime so repeated instantiations skip the re-parse
+        return dict(_load_config_cached(file_path, os.path.getmtime(file_path)))
     except FileNotFoundError:
         logger.error(f"Configuration file '{file_path}' not found!")
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing configuration file '{file_path}': {e}")
+    except ValueError as e:
+        logger.error(f"Invalid value in configuration file '{file_path}': {e}")
     except Exception as e:
         logger.exception(f"Error reading configuration file: {e}")
-    
-    return config
+
+    return {}
 
 
 if __name__ == "__main__":